@@ -1,11 +1,17 @@
 # From OpenAI Cookbook: https://timw.info/k71
 
+import functools
 import tiktoken
 import os
 
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name: str):
+    """Load an encoding once and reuse it for every call."""
+    return tiktoken.get_encoding(encoding_name)
+
 def num_tokens_from_string(string: str, encoding_name: str) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
@@ -0,0 +1,422 @@
+"""
+Benchmarks for the token and context utilities in prompt_engineering_examples.py
+
+Run with:
+    python examples/benchmarks.py                 # all benchmarks
+    python examples/benchmarks.py count_many      # one benchmark
+
+Requires tiktoken for meaningful token-counting numbers; the fallback benchmark
+uses it as the reference the estimator is measured against.
+"""
+
+import argparse
+import csv
+import glob
+import os
+import pathlib
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+from prompt_engineering_examples import (
+    FALLBACK_ERROR_BOUND, ContextManager, ConversationMemory, ConversationSessions,
+    HashingEmbedder, SQLiteConversationStore, TokenCounter, UsageLedger, classify_content,
+    estimate_tokens, get_encoder,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_ROOT, "data")
+
+
+def load_bank_marketing_prompts() -> list:
+    """Render every row of data/bankmarketing_train.csv as a short prompt"""
+    path = os.path.join(DATA_DIR, "bankmarketing_train.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [
+        "Predict whether this customer subscribes to a term deposit.\n"
+        + "\n".join(f"{key}: {value}" for key, value in row.items() if key != "y")
+        for row in rows
+    ]
+
+
+def bench_count_many():
+    """count() in a loop vs count_many() on every bank-marketing row"""
+    prompts = load_bank_marketing_prompts()
+    counter = TokenCounter()
+
+    start = time.perf_counter()
+    looped = [counter.count(prompt) for prompt in prompts]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = counter.count_many(prompts)
+    batch_time = time.perf_counter() - start
+
+    assert looped == batched
+    print(f"=== count_many ({len(prompts):,} prompts, {sum(batched):,} tokens) ===")
+    print(f"count() loop:  {loop_time:.3f}s  ({len(prompts) / loop_time:,.0f} prompts/sec)")
+    print(f"count_many():  {batch_time:.3f}s  ({len(prompts) / batch_time:,.0f} prompts/sec)")
+    print()
+
+
+def fractional_knapsack_bound(costs, values, budget) -> float:
+    """Upper bound on the best 0/1 knapsack value: the optimal fractional fill"""
+    bound = 0.0
+    for i in sorted(range(len(costs)), key=lambda i: values[i] / max(costs[i], 1), reverse=True):
+        take = min(1.0, budget / max(costs[i], 1))
+        bound += take * values[i]
+        budget -= take * costs[i]
+        if budget <= 0:
+            break
+    return bound
+
+
+def bench_packing(sizes=(100, 300, 1000), budget_fraction=0.25, repeats=200):
+    """Priority-order packing vs knapsack packing of many components"""
+    prompts = load_bank_marketing_prompts()
+    counter = TokenCounter()
+    rng = random.Random(42)
+    print(f"=== context packing (budget {budget_fraction:.0%} of total tokens) ===")
+    print(f"{'components':>10}{'priority value':>16}{'knapsack value':>16}{'upper bound':>13}"
+          f"{'tokens used':>13}{'plan time':>11}")
+
+    for size in sizes:
+        # Components of very different sizes, valued by priority rank
+        texts = ["\n".join(rng.sample(prompts, rng.choice((1, 1, 2, 4, 16, 64)))) for _ in range(size)]
+        costs = counter.count_many(texts)
+        values = [size - rank for rank in range(size)]
+        budget = int(sum(costs) * budget_fraction)
+
+        priority_value = 0
+        used = 0
+        for cost, value in zip(costs, values):
+            if used + cost > budget:
+                break
+            used += cost
+            priority_value += value
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            chosen = ContextManager._plan_knapsack(costs, values, budget)
+        plan_time = (time.perf_counter() - start) / repeats
+
+        knapsack_value = sum(values[i] for i in chosen)
+        knapsack_used = sum(costs[i] for i in chosen)
+        bound = fractional_knapsack_bound(costs, values, budget)
+        print(f"{size:>10}{priority_value:>16,}{knapsack_value:>16,}{bound:>13,.0f}"
+              f"{knapsack_used / budget:>13.1%}{plan_time * 1000:>9.3f}ms")
+    print()
+
+
+def bench_streaming(sizes_mb=(16, 256), max_tokens=100_000):
+    """build_streaming_context from large files: time and memory should not grow with file size"""
+    source = "".join(load_bank_marketing_prompts()[:2000]) + "\n"
+    print(f"=== streaming context ({max_tokens:,}-token budget) ===")
+    print(f"{'source size':>12}{'time':>10}{'context tokens':>16}{'peak memory':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in sizes_mb:
+            path = pathlib.Path(tmp, f"knowledge_{size_mb}mb.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                written = 0
+                while written < size_mb * 1024 * 1024:
+                    written += f.write(source)
+
+            manager = ContextManager(max_tokens=max_tokens)
+            tracemalloc.start()
+            start = time.perf_counter()
+            context = manager.build_streaming_context(
+                {"system": "You are a helpful assistant.", "knowledge": path},
+                ["system", "knowledge"],
+            )
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del context
+            print(f"{size_mb:>10}MB{elapsed:>9.3f}s{manager.context_tokens:>16,}{peak / 1e6:>11.1f}MB")
+    print()
+
+
+def bench_ledger(calls=1_000_000):
+    """UsageLedger recording and aggregation vs keeping a dict per call"""
+    models = ["gpt-4o", "gpt-4-turbo", "claude-3.5-sonnet"]
+    rng = random.Random(7)
+    usage = [(models[i % 3], rng.randint(100, 4000), rng.randint(10, 800), rng.random() * 3)
+             for i in range(calls)]
+    print(f"=== usage ledger ({calls:,} calls) ===")
+
+    tracemalloc.start()
+    per_call = [{"model": m, "input_tokens": i, "output_tokens": o, "latency": l, "ts": time.time()}
+                for m, i, o, l in usage]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    del per_call
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, persist_path in (("in memory", None), ("SQLite", os.path.join(tmp, "ledger.db"))):
+            tracemalloc.start()
+            ledger = UsageLedger(persist_path=persist_path)
+            start = time.perf_counter()
+            for model, input_tokens, output_tokens, latency in usage:
+                ledger.record(model, input_tokens, output_tokens, latency)
+            record_time = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            summary = ledger.summary()
+            summary_time = time.perf_counter() - start
+            ledger.close()
+            print(f"{label:<10} {calls / record_time:>10,.0f} calls/sec  peak {peak / 1e6:>6.1f}MB  "
+                  f"summary {summary_time:.3f}s  total ${sum(row['total_cost'] for row in summary):,.2f}")
+    print(f"{'dicts':<10} {'':>21}  held {dict_bytes / 1e6:>6.1f}MB")
+    print()
+
+
+class ListMemory:
+    """The original list-backed ConversationMemory: slices on every append, re-renders on every read"""
+
+    def __init__(self, max_messages):
+        self.max_messages = max_messages
+        self.messages = []
+
+    def add_message(self, role, content):
+        self.messages.append({"role": role, "content": content})
+        if len(self.messages) > self.max_messages:
+            self.messages = self.messages[-self.max_messages:]
+
+    def get_context(self):
+        context = "Recent conversation:\n"
+        for msg in self.messages:
+            context += f"{msg['role']}: {msg['content']}\n"
+        return context
+
+
+def bench_memory(turns=100_000, windows=(10, 100, 1000), reads_per_turn=2):
+    """ConversationMemory vs the list-backed original over a long conversation"""
+    prompts = load_bank_marketing_prompts()
+    contents = [prompts[i % len(prompts)][:200] for i in range(turns)]
+    print(f"=== conversation memory ({turns:,} turns, {reads_per_turn} get_context() per turn) ===")
+    print(f"{'window':>8}{'list + slicing':>16}{'deque + cache':>15}{'get_context only':>18}")
+
+    for window in windows:
+        results = []
+        for memory in (ListMemory(window), ConversationMemory(max_messages=window)):
+            read_time = 0.0
+            start = time.perf_counter()
+            for i, content in enumerate(contents):
+                memory.add_message("user" if i % 2 == 0 else "assistant", content)
+                read_start = time.perf_counter()
+                for _ in range(reads_per_turn):
+                    memory.get_context()
+                read_time += time.perf_counter() - read_start
+            results.append((time.perf_counter() - start, read_time))
+        (list_total, list_reads), (deque_total, deque_reads) = results
+        print(f"{window:>8}{list_total:>15.2f}s{deque_total:>14.2f}s"
+              f"{list_reads:>9.2f}s ->{deque_reads:>5.2f}s")
+    print()
+
+
+def bench_sessions(sessions=2000, exchanges_per_session=5, hot_sessions=500):
+    """ConversationSessions over a sharded SQLite store: bounded memory across many sessions"""
+    prompts = load_bank_marketing_prompts()
+    rng = random.Random(3)
+    # Each exchange is a user message and a reply; exchanges of all sessions interleave
+    exchanges = [f"session-{n}" for n in range(sessions) for _ in range(exchanges_per_session)]
+    rng.shuffle(exchanges)
+    turns = [session_id for session_id in exchanges for _ in range(2)]
+    print(f"=== conversation sessions ({sessions:,} sessions, {len(turns):,} messages, "
+          f"{hot_sessions} hot) ===")
+
+    def run(directory):
+        store = SQLiteConversationStore(directory)
+        manager = ConversationSessions(store, max_hot_sessions=hot_sessions)
+        start = time.perf_counter()
+        for i, session_id in enumerate(turns):
+            manager.add_message(session_id, "user" if i % 2 == 0 else "assistant",
+                                prompts[i % len(prompts)][:200])
+        store.flush()
+        elapsed = time.perf_counter() - start
+        store.close()
+        return elapsed, manager.loads
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Timed and memory-traced separately: tracing slows everything down
+        elapsed, loads = run(tmp)
+        with tempfile.TemporaryDirectory() as traced_tmp:
+            tracemalloc.start()
+            run(traced_tmp)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        print(f"append:  {len(turns) / elapsed:>10,.0f} messages/sec  {loads:,} session loads  "
+              f"peak {peak / 1e6:.1f}MB")
+
+        # A restarted worker loads sessions from disk on first use
+        store = SQLiteConversationStore(tmp)
+        manager = ConversationSessions(store, max_hot_sessions=hot_sessions)
+        sample = rng.sample(range(sessions), min(sessions, 1000))
+        start = time.perf_counter()
+        for n in sample:
+            manager.get_context(f"session-{n}")
+        elapsed = time.perf_counter() - start
+        print(f"restart: {elapsed / len(sample) * 1e6:>10,.0f} us per cold session load")
+        store.close()
+    print()
+
+
+def bench_vector(turns=1_000_000, dim=64, batch=50_000, queries=100):
+    """Vector-strategy recall over a very long conversation"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print("=== vector recall: skipped, numpy not installed ===\n")
+        return
+
+    lines = [line for prompt in load_bank_marketing_prompts()[:5000] for line in prompt.splitlines()[1:]]
+    rng = random.Random(11)
+    memory = ConversationMemory(strategy="vector", max_messages=20, recall_k=5,
+                                embedder=HashingEmbedder(dim=dim))
+    print(f"=== vector recall ({turns:,} turns, {dim}-dim embeddings) ===")
+
+    start = time.perf_counter()
+    for offset in range(0, turns, batch):
+        memory.add_messages(
+            ("user" if i % 2 == 0 else "assistant", " ".join(rng.sample(lines, 3)))
+            for i in range(offset, min(turns, offset + batch))
+        )
+    insert_time = time.perf_counter() - start
+
+    probes = [" ".join(rng.sample(lines, 2)) for _ in range(queries)]
+    start = time.perf_counter()
+    for probe in probes:
+        memory.recall(probe)
+    recall_time = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    memory.get_context()
+    context_time = time.perf_counter() - start
+
+    print(f"insert (count + embed): {turns / insert_time:>10,.0f} turns/sec")
+    print(f"recall top-5:           {recall_time * 1000:>10.1f} ms per query")
+    print(f"get_context():          {context_time * 1000:>10.1f} ms")
+    print(f"embedding matrix:       {memory._vectors[:memory._vector_count].nbytes / 1e6:>10.1f} MB")
+    print()
+
+
+# data/ has no CJK or other non-Latin text, so the fallback benchmark uses
+# these short samples, one per language
+CJK_SAMPLES = [
+    "提示工程是设计和优化输入提示的过程，目的是让大型语言模型产生更准确、更有用的输出。"
+    "好的提示通常包含明确的任务说明、相关的上下文、示例以及期望的输出格式。\n"
+    "机器学习模型需要大量高质量的数据进行训练。在实际应用中，我们经常需要对数据进行清洗和标注，"
+    "然后才能开始训练。评估模型时，应当使用独立的测试集，以避免过拟合带来的误导。\n",
+    "プロンプトエンジニアリングとは、言語モデルから望ましい出力を得るために指示を設計する技術です。"
+    "具体的な例を示し、出力形式を指定すると、結果の品質が大きく向上します。\n"
+    "今日はとても良い天気なので、公園を散歩することにしました。桜の花がきれいに咲いていて、"
+    "多くの人が写真を撮っていました。帰りに駅前のカフェでコーヒーを飲みました。\n",
+    "프롬프트 엔지니어링은 언어 모델이 더 정확한 답변을 생성하도록 입력을 설계하는 과정입니다.\n"
+    "오늘은 날씨가 좋아서 친구들과 함께 한강 공원에 갔습니다. 자전거를 타고 맛있는 음식을 먹으며 "
+    "즐거운 시간을 보냈습니다. 다음 주에도 다시 가기로 약속했습니다.\n",
+]
+OTHER_SCRIPT_SAMPLES = [
+    "Машинное обучение позволяет компьютерам находить закономерности в данных без явного "
+    "программирования. Качество модели во многом зависит от подготовки данных.\n",
+    "Η μηχανική μάθηση επιτρέπει στους υπολογιστές να βρίσκουν μοτίβα στα δεδομένα χωρίς "
+    "ρητό προγραμματισμό.\n",
+    "يسمح التعلم الآلي لأجهزة الكمبيوتر بالعثور على أنماط في البيانات دون برمجة صريحة.\n",
+]
+
+FALLBACK_CORPORA = {
+    "prose": ["data-files-for-analysis/news_articles.txt",
+              "data-files-for-analysis/PROMPT_ENGINEERING_GUIDE.md",
+              "data-files-for-analysis/README.md"],
+    "code": ["*.sql", "*.ps1", "dls.bicep"],
+    "json": ["data-files-for-analysis/products.json", "*.ipynb"],
+    "csv": ["titanic.csv", "data-files-for-analysis/*.csv"],
+}
+
+
+def load_fallback_chunks(chunk_chars=2000) -> dict:
+    """Split the data/ corpora into chunks of roughly chunk_chars, keyed by content class"""
+    chunks = {}
+    for label, patterns in FALLBACK_CORPORA.items():
+        texts = []
+        for pattern in patterns:
+            for path in sorted(glob.glob(os.path.join(DATA_DIR, pattern))):
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    texts.append(f.read())
+        chunks[label] = [
+            text[i:i + chunk_chars]
+            for text in texts
+            for i in range(0, len(text), chunk_chars)
+        ]
+    chunks["cjk"] = CJK_SAMPLES
+    chunks["other"] = OTHER_SCRIPT_SAMPLES
+    return chunks
+
+
+def bench_fallback():
+    """Accuracy and speed of estimate_tokens() against cl100k_base, per content class"""
+    chunks = load_fallback_chunks()
+    encoding = get_encoder(encoding_name="cl100k_base")
+    print("=== fallback estimator ===")
+    if encoding is None:
+        print("tiktoken not installed: reporting estimates and speed only")
+    else:
+        print(f"measured error bound: ±{FALLBACK_ERROR_BOUND:.0%} vs cl100k_base "
+              f"(p95, Latin-script and CJK text)")
+    print(f"{'corpus':<7}{'chunks':>7}{'class':>7}{'tokens':>9}{'est':>9}"
+          f"{'mean err':>10}{'p95 err':>9}{'len/4 err':>11}{'MB/s':>7}")
+
+    for label, texts in chunks.items():
+        start = time.perf_counter()
+        estimates = [estimate_tokens(text) for text in texts]
+        elapsed = time.perf_counter() - start
+        chars = sum(len(text) for text in texts)
+        detected = Counter(map(classify_content, texts)).most_common(1)[0][0]
+        row = f"{label:<7}{len(texts):>7}{detected:>7}"
+        speed = f"{chars / elapsed / 1e6:>7.1f}"
+        if encoding is None:
+            print(f"{row}{'-':>9}{sum(estimates):>9,}{'-':>10}{'-':>9}{'-':>11}{speed}")
+            continue
+
+        actual = [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+        errors = sorted(abs(est - act) / act for est, act in zip(estimates, actual) if act)
+        naive = [abs(len(text) // 4 - act) / act for text, act in zip(texts, actual) if act]
+        mean_err = sum(errors) / len(errors)
+        p95_err = errors[min(len(errors) - 1, int(len(errors) * 0.95))]
+        verdict = "" if p95_err <= FALLBACK_ERROR_BOUND else "  over bound"
+        print(f"{row}{sum(actual):>9,}{sum(estimates):>9,}{mean_err:>10.1%}{p95_err:>9.1%}"
+              f"{sum(naive) / len(naive):>11.1%}{speed}{verdict}")
+    print()
+
+
+BENCHMARKS = {
+    "count_many": bench_count_many,
+    "fallback": bench_fallback,
+    "packing": bench_packing,
+    "streaming": bench_streaming,
+    "ledger": bench_ledger,
+    "memory": bench_memory,
+    "sessions": bench_sessions,
+    "vector": bench_vector,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
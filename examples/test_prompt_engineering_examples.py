@@ -0,0 +1,27 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from prompt_engineering_examples import sentence_boundaries
+
+
+class TestSentenceBoundaries(unittest.TestCase):
+    """Splitting text into sentences for compression"""
+
+    def test_abbreviations_do_not_end_sentences(self):
+        text = "Dr. Smith arrived. He sat down."
+        self.assertEqual(sentence_boundaries(text), [18, len(text)])
+
+    def test_long_word_run_is_linear(self):
+        # Quadratic matching took over a second on 5k characters
+        for text in ("a" * 40_000, "a." * 20_000 + "a", "deadbeef" * 5_000 + ". End."):
+            start = time.perf_counter()
+            boundaries = sentence_boundaries(text)
+            self.assertLess(time.perf_counter() - start, 0.5)
+            self.assertEqual(boundaries[-1], len(text))
+
+
+if __name__ == "__main__":
+    unittest.main()
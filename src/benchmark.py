@@ -0,0 +1,179 @@
+"""
+benchmark.py - Throughput benchmarks for pretty_logger
+
+Run with:
+    python src/benchmark.py
+    python src/benchmark.py --lines 200000
+    python src/benchmark.py --import-only      # exit 1 if the import budget is exceeded
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from pretty_logger import LogAggregator, PrettyLogger, connect_to_aggregator, logger as shared_logger
+
+
+class NullStream:
+    """Stdout replacement that discards everything, so only logger cost is measured"""
+
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class NullSink:
+    """Aggregator sink that discards lines"""
+    output = None
+
+    def write_lines(self, lines):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def null_sinks():
+    return [NullSink()]
+
+
+def lines_per_second(logger, lines):
+    """Emit `lines` records through `logger` and return the achieved rate"""
+    payload = {"user_id": "user_1234", "status": "success", "took": "0.42s"}
+    with contextlib.redirect_stdout(NullStream()):
+        start = time.perf_counter()
+        for i in range(lines):
+            logger.info("Processed request", i, payload)
+        logger.flush()
+        elapsed = time.perf_counter() - start
+    return lines / elapsed
+
+
+def bench_output_modes(lines):
+    """Compare the pretty console format with JSON-lines output"""
+    modes = {
+        "pretty": PrettyLogger("bench", level="info", output="pretty"),
+        "json": PrettyLogger("bench", level="info", output="json"),
+    }
+    try:
+        import orjson
+        modes["json (orjson)"] = PrettyLogger(
+            "bench", level="info", output="json",
+            serializer=lambda record: orjson.dumps(record, default=str),
+        )
+    except ImportError:
+        pass
+
+    print(f"Output modes ({lines:,} lines each)")
+    for name, logger in modes.items():
+        print(f"  {name:<16} {lines_per_second(logger, lines):>12,.0f} lines/sec")
+
+
+def _worker_emit(lines):
+    payload = {"user_id": "user_1234", "status": "success"}
+    for i in range(lines):
+        shared_logger.info("Processed request", i, payload)
+    shared_logger.flush()
+
+
+def bench_processes(lines, worker_counts=(1, 4, 16)):
+    """Aggregate the same total number of lines from 1, 4 and 16 worker processes"""
+    print(f"Multi-process aggregation ({lines:,} lines total, JSON)")
+    for workers in worker_counts:
+        aggregator = LogAggregator(output="json", sink_factory=null_sinks).start()
+        per_worker = lines // workers
+        start = time.perf_counter()
+        pool = multiprocessing.Pool(workers, initializer=connect_to_aggregator,
+                                    initargs=(aggregator.queue, "json"))
+        pool.map(_worker_emit, [per_worker] * workers)
+        # close/join (not terminate) lets workers finish feeding the queue
+        pool.close()
+        pool.join()
+        aggregator.stop()
+        elapsed = time.perf_counter() - start
+        rate = per_worker * workers / elapsed
+        print(f"  {workers:>2} worker(s)      {rate:>12,.0f} lines/sec")
+
+
+# Modules that pretty_logger defers until a feature needs them
+DEFERRED_MODULES = ("json", "logging", "multiprocessing", "gzip", "random", "datetime", "colorama")
+
+# Target for `import pretty_logger` on a typical developer machine
+IMPORT_BUDGET_MS = 25.0
+
+
+def measure_import(runs=5):
+    """
+    Import pretty_logger with `python -X importtime` in fresh interpreters.
+    Returns (best time in ms, what the import printed to stdout, the deferred
+    modules it imported, comma-separated).
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure the cached-bytecode import users get
+    # Only modules the import itself adds count: site hooks may load some at startup
+    probe = ("import sys; preloaded = set(sys.modules); import pretty_logger; "
+             f"print(','.join(m for m in {DEFERRED_MODULES!r} "
+             "if m in sys.modules and m not in preloaded), file=sys.stderr)")
+
+    timings = []
+    for _ in range(runs + 1):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                                cwd=src_dir, env=env, capture_output=True, text=True)
+        stderr_lines = result.stderr.strip().splitlines()
+        for line in stderr_lines:
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == "pretty_logger":
+                timings.append(int(fields[1]) / 1000)
+        loaded = stderr_lines[-1] if stderr_lines and "|" not in stderr_lines[-1] else ""
+        printed = result.stdout
+    # The first run may compile the module, so it is not counted
+    return min(timings[1:]), printed, loaded
+
+
+def check_import_budget(budget_ms, runs=5):
+    """
+    Check that `import pretty_logger` stays under budget, prints nothing, and
+    does not pull in the deferred modules. Returns True when every check passes.
+    """
+    best, printed, loaded = measure_import(runs)
+    ok = best <= budget_ms and not printed and not loaded
+    print(f"Import time: {best:.1f} ms (budget {budget_ms} ms) - {'OK' if ok else 'FAILED'}")
+    if printed:
+        print(f"  import printed to stdout: {printed.strip()!r}")
+    if loaded:
+        print(f"  deferred modules imported eagerly: {loaded}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=50000, help="records per benchmark")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS,
+                        help="maximum time for `import pretty_logger`")
+    parser.add_argument("--import-only", action="store_true", help="only run the import budget check")
+    args = parser.parse_args()
+
+    if not check_import_budget(args.import_budget_ms):
+        sys.exit(1)
+    if args.import_only:
+        return
+
+    bench_output_modes(args.lines)
+    bench_processes(args.lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,20 +13,22 @@ from pretty_logger import logger
 async def simulate_api_call(name, min_time=0.3, max_time=1.2):
     """Simulate an API call with random delay"""
     delay = random.uniform(min_time, max_time)
-    logger.debug(f"Starting {name} API call", {"expected_delay": f"{delay:.2f}s"})
-    await asyncio.sleep(delay)
+    async with logger.span(f"{name} API call"):
+        await asyncio.sleep(delay)
     return {"status": "success", "data": f"{name} response", "took": f"{delay:.2f}s"}
 
 async def process_user_data():
     """Process user data with beautiful logging"""
     user_id = f"user_{random.randint(1000, 9999)}"
+    # Every record logged from this task now carries user_id
+    logger.bind(user_id=user_id)
     
-    logger.info(f"Processing data for {user_id}")
+    logger.info("Processing user data")
     
     # Simulate user authentication
     auth_result = await simulate_api_call("authentication")
     if auth_result["status"] == "success":
-        logger.success(f"User {user_id} authenticated", auth_result)
+        logger.success("User authenticated", auth_result)
     
     # Simulate profile loading
     try:
@@ -34,30 +36,32 @@ async def process_user_data():
             raise Exception("Profile not found in database")
         
         profile = await simulate_api_call("profile")
-        logger.info(f"Loaded profile for {user_id}", profile)
+        logger.info("Loaded profile", profile)
     except Exception as e:
-        logger.error(f"Failed to load profile for {user_id}", {"error": str(e)})
+        logger.error("Failed to load profile", {"error": str(e)})
     
     # Simulate permissions check
     permissions = await simulate_api_call("permissions")
     access_level = random.choice(["admin", "user", "guest"])
-    logger.info(f"User {user_id} has {access_level} permissions")
+    logger.info("User has %s permissions", access_level)
     
     if access_level == "guest":
-        logger.warn(f"Limited access for {user_id}", {
+        logger.warn("Limited access", {
             "reason": "Guest account has restricted permissions",
             "upgradePath": "/upgrade-account"
         })
     
     # Simulate completing the process
-    logger.success(f"Completed processing for {user_id}")
+    logger.success("Completed processing")
 
 async def main():
     """Main demo function"""
     # Enable debug for this demo
-    import os
-    os.environ["DEBUG"] = "true"
+    logger.set_level("debug")
     
+    # Queue log records so the event loop never blocks on stdout
+    logger.enable_queue(overflow="drop-debug-first")
+
     logger.divider("🔮 PYTHON ASYNC LOGGER DEMO")
     
     logger.info("Starting application...")
@@ -78,7 +82,9 @@ async def main():
     await asyncio.gather(*tasks)
     
     logger.info("All processing complete")
+    logger.dump_spans()
     logger.divider_end()
+    logger.flush()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
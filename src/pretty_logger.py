@@ -9,22 +9,87 @@ Usage:
     logger.error("Failed to connect to database")
     logger.success("Operation completed successfully")
     logger.debug("Variable state:", {"foo": "bar"})
+
+Levels below the threshold cost a single comparison. The threshold comes from
+LOG_LEVEL (debug, info, success, warn, error), or DEBUG=true for debug output:
+    logger.set_level("warn")
+    logger.debug("Loaded %d rows from %s", count, path)   # formatted only if emitted
+    logger.debug("State:", lazy(expensive_snapshot))     # called only if emitted
+
+JSON-lines mode (no colors or emoji; dict arguments become structured fields):
+    logger = PrettyLogger("api", output="json")        # or LOG_FORMAT=json
+    logger.info("Request handled", {"status": 200})
+    # {"ts":"...","level":"info","logger":"api","msg":"Request handled","fields":{"status":200}}
+
+Bounding repetitive output (token bucket per message template, plus sampling):
+    logger.set_rate_limit(rate=5, burst=20)       # "Suppressed N similar messages" summaries
+    logger.set_sampling({"debug": 0.01})          # keep ~1% of debug records
+
+Context fields (bound per asyncio task / thread via contextvars, attached to every record):
+    logger.bind(user_id=user_id)                  # rest of this task
+    with logger.context(request_id=request_id):   # just this block
+        logger.info("Loaded profile")
+
+Timing spans (sync or async, as a context manager or decorator):
+    with logger.span("load profile", user_id=user_id):
+        ...
+    @logger.span("authenticate")
+    async def authenticate(): ...
+    logger.dump_spans()                           # count, p50/p95/p99 per span name
+
+Extra sinks (each record is rendered once per output format, then fanned out):
+    logger.add_sink(FileSink("logs/app.log", output="json", max_bytes=10_000_000, compress=True))
+
+Multiple processes (workers ship rendered lines to one writer process):
+    aggregator = LogAggregator(output="json")
+    aggregator.start()
+    pool = multiprocessing.Pool(4, initializer=connect_to_aggregator,
+                                initargs=(aggregator.queue, "json"))
+    ...
+    pool.close()
+    pool.join()        # not terminate(): workers must finish feeding the queue
+    aggregator.stop()
+
+Queued mode (for async workloads; a background thread formats and writes):
+    logger.enable_queue(max_queue_size=10000, overflow="drop-oldest")
+    ...
+    logger.flush()
 """
 
-import json
-import logging
+# Imports are kept to what every logger needs: json, multiprocessing, gzip,
+# random, signal and colorama are imported where they are first used, so that
+# importing this module stays cheap for CLI tools.
+import atexit
+import collections
+import contextlib
+import contextvars
+import functools
+import math
 import os
+import re
 import sys
-import datetime
-from typing import Any, Dict, List, Optional, Union
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Union
 
-try:
-    # Try to import colorama for Windows color support
-    from colorama import init as colorama_init
+_console_colors_ready = False
+
+
+def _init_console_colors(stream):
+    """Enable ANSI colors on Windows consoles via colorama, once, on the first TTY write"""
+    global _console_colors_ready
+    _console_colors_ready = True
+    if os.name != "nt":
+        return
+    try:
+        if not stream.isatty():
+            return
+        from colorama import init as colorama_init
+    except (ImportError, AttributeError, ValueError):
+        # Without colorama, Windows terminals that lack VT support show raw escape codes
+        return
     colorama_init()
-except ImportError:
-    print("⚠️  For better color support on Windows, install colorama:")
-    print("pip install colorama")
 
 # ANSI color codes
 class Colors:
@@ -41,82 +106,1237 @@ class Colors:
     BG_BLACK = "\033[40m"
 
 
+DEBUG = 10
+INFO = 20
+SUCCESS = 25
+WARNING = 30
+ERROR = 40
+
+LEVELS = {
+    "debug": DEBUG,
+    "info": INFO,
+    "success": SUCCESS,
+    "warn": WARNING,
+    "warning": WARNING,
+    "error": ERROR,
+}
+
+OUTPUT_MODES = ("pretty", "json")
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "drop-debug-first")
+
+# printf-style conversion specifiers; the space flag is left out so that text
+# like "50% done" is not mistaken for a format string
+_PERCENT_SPEC = (r"%(?:\([^)]*\))?[#0+-]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[diouxXeEfFgGcrsa%]")  # compiled lazily by re's cache
+
+class _Lazy:
+    """A log argument computed at format time; see lazy()"""
+    __slots__ = ("func",)
+
+    def __init__(self, func: Callable[[], Any]):
+        self.func = func
+
+    def __repr__(self):
+        return f"lazy({self.func!r})"
+
+
+def lazy(func: Callable[[], Any]) -> _Lazy:
+    """
+    Mark a zero-argument callable as a deferred log argument: it is only
+    called if the record is emitted, and its result is logged. Other
+    callables are logged as they are, never called.
+    """
+    return _Lazy(func)
+
+
+@functools.lru_cache(maxsize=None)
+def _compact_json_encoder() -> Callable[[Any], str]:
+    import json
+    return json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str).encode
+
+
+def _random_fraction() -> float:
+    import random
+    return random.random()
+
+
+def _report_internal_error(where: str, error: BaseException):
+    """Logging must never take the application down; describe the failure on stderr instead"""
+    try:
+        sys.stderr.write(f"pretty_logger: {where} failed: {error!r}\n")
+    except Exception:
+        pass
+
+
+def _resolve_level(level: Union[int, str]) -> int:
+    """Turn a level name or number into its numeric value"""
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[level.strip().lower()]
+    except KeyError:
+        raise ValueError(f"Unknown log level: {level!r} (expected one of {sorted(LEVELS)})") from None
+
+
+def _default_level() -> int:
+    """Threshold from LOG_LEVEL, falling back to the DEBUG flag"""
+    env_level = os.environ.get("LOG_LEVEL")
+    if env_level:
+        try:
+            return _resolve_level(env_level)
+        except ValueError:
+            # The module-level logger is built at import; a typo must not break importers
+            sys.stderr.write(f"pretty_logger: ignoring LOG_LEVEL={env_level!r} "
+                             f"(expected one of {sorted(LEVELS)}), using info\n")
+            return INFO
+    if os.environ.get("DEBUG", "false").lower() in ["true", "1", "yes"]:
+        return DEBUG
+    return INFO
+
+
+def _default_output() -> str:
+    """Output mode from LOG_FORMAT, falling back to pretty"""
+    env_output = (os.environ.get("LOG_FORMAT") or "pretty").strip().lower()
+    if env_output not in OUTPUT_MODES:
+        sys.stderr.write(f"pretty_logger: ignoring LOG_FORMAT={env_output!r} "
+                         f"(expected one of {OUTPUT_MODES}), using pretty\n")
+        return "pretty"
+    return env_output
+
+
+RATE_LIMIT_KEYS = ("template", "call_site")
+
+
+class _TerminalWidth:
+    """
+    Cached width of stdout. The cache is dropped on SIGWINCH or when stdout is
+    replaced; where SIGWINCH is unavailable it is re-read at most once a second.
+    """
+
+    DEFAULT = 80
+
+    def __init__(self):
+        self._width = None
+        self._stream = None
+        self._checked_at = 0.0
+        self._watching = False
+
+    def get(self) -> int:
+        stream = sys.stdout
+        width = self._width
+        if width is not None and stream is self._stream:
+            if self._watching or time.monotonic() - self._checked_at < 1.0:
+                return width
+        return self._refresh(stream)
+
+    def _refresh(self, stream) -> int:
+        try:
+            tty = stream.isatty()
+        except (AttributeError, ValueError):
+            tty = False
+        width = self.DEFAULT
+        if tty:
+            try:
+                width = os.get_terminal_size(stream.fileno()).columns
+            except (AttributeError, ValueError, OSError):
+                pass
+            self._watch_resizes()
+        self._width, self._stream, self._checked_at = width, stream, time.monotonic()
+        return width
+
+    def _watch_resizes(self):
+        """Install a SIGWINCH handler (main thread only) that invalidates the cache"""
+        if self._watching or os.name == "nt":
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return
+        import signal
+        previous = signal.getsignal(signal.SIGWINCH)
+
+        def on_resize(signum, frame):
+            self._width = None
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(signal.SIGWINCH, on_resize)
+        self._watching = True
+
+
+_terminal_width = _TerminalWidth()
+
+
+# Dividers only depend on title and width, so each one is rendered once
+@functools.lru_cache(maxsize=256)
+def _render_divider(title: str, width: int) -> str:
+    if title:
+        line = "─" * (width - len(title) - 4)
+        return f"{Colors.DIM}┌─ {Colors.BOLD}{title}{Colors.RESET}{Colors.DIM} {line}{Colors.RESET}"
+    line = "─" * (width - 2)
+    return f"{Colors.DIM}┌{line}┐{Colors.RESET}"
+
+
+@functools.lru_cache(maxsize=16)
+def _render_divider_end(width: int) -> str:
+    line = "─" * (width - 2)
+    return f"{Colors.DIM}└{line}┘{Colors.RESET}"
+
+
+class _RateLimiter:
+    """Token bucket per message key, remembering how many records each key suppressed"""
+
+    def __init__(self, rate: float, burst: int, by: str, levels: tuple,
+                 summary_interval: float, max_keys: int = 1024):
+        if by not in RATE_LIMIT_KEYS:
+            raise ValueError(f"Unknown rate limit key: {by!r} (expected one of {RATE_LIMIT_KEYS})")
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.by = by
+        self.levels = frozenset(levels)
+        self.summary_interval = summary_interval
+        self.max_keys = max_keys
+
+        # key -> [tokens, last refill time, suppressed count]
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_summary = time.monotonic() + summary_interval
+        self._timer = None  # reports the summary if no later record is admitted to do it
+
+    def allow(self, key, now: float) -> bool:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            bucket[2] += 1
+            return False
+
+    def _evict(self):
+        """Drop the oldest key that has nothing left to report"""
+        for key, bucket in self._buckets.items():
+            if not bucket[2]:
+                del self._buckets[key]
+                return
+        del self._buckets[next(iter(self._buckets))]
+
+    def take_summary(self, now: float, force: bool = False) -> List[tuple]:
+        """Return (key, suppressed) pairs once per summary interval and reset the counts"""
+        if not force and now < self._next_summary:
+            return []
+        with self._lock:
+            self._next_summary = now + self.summary_interval
+            summary = [(key, bucket[2]) for key, bucket in self._buckets.items() if bucket[2]]
+            for bucket in self._buckets.values():
+                bucket[2] = 0
+        return summary
+
+
+class _LatencyHistogram:
+    """
+    Log-bucketed latency histogram: constant memory per span name, and
+    percentiles accurate to the bucket growth factor (about 5%).
+    """
+
+    GROWTH = 1.05
+    _LOG_GROWTH = math.log(GROWTH)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets = collections.Counter()
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        micros = seconds * 1e6
+        self._buckets[int(math.log(micros) / self._LOG_GROWTH) if micros > 1 else 0] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound (seconds) of the bucket holding the given fraction of samples"""
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(self.GROWTH ** (index + 1) / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+        }
+
+
+class _Span:
+    """Times a block (with / async with) or every call of a decorated function"""
+    __slots__ = ("logger", "name", "level", "fields", "site", "_start")
+
+    def __init__(self, logger: "PrettyLogger", name: str, level: str, fields: Dict[str, Any],
+                 site: tuple):
+        self.logger = logger
+        self.name = name
+        self.level = level
+        self.fields = fields
+        self.site = site  # (file, line) of the span() call, its key for call-site rate limiting
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.logger._finish_span(self, time.perf_counter() - self._start, exc_type)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, func):
+        # A fresh span per call, so concurrent calls are timed independently
+        import inspect
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                async with _Span(self.logger, self.name, self.level, self.fields, self.site):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(self.logger, self.name, self.level, self.fields, self.site):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class _BoundContext:
+    """Immutable set of bound fields, with its console rendering computed once at bind time"""
+    __slots__ = ("fields", "pretty")
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+        pairs = " ".join(f"{key}={value}" for key, value in fields.items())
+        self.pretty = f"{Colors.DIM}[{pairs}]{Colors.RESET} " if fields else ""
+
+
+_EMPTY_CONTEXT = _BoundContext({})
+
+# Fields bound with PrettyLogger.bind(); each asyncio task and thread sees its own copy
+_bound_context = contextvars.ContextVar("pretty_logger_context", default=_EMPTY_CONTEXT)
+
+
+class _Record:
+    """A queued log call; formatting is deferred to the writer thread"""
+    __slots__ = ("created", "level", "args", "context")
+
+    def __init__(self, created: float, level: Optional[str], args: tuple,
+                 context: _BoundContext = _EMPTY_CONTEXT):
+        self.created = created
+        self.level = level
+        self.args = args
+        self.context = context
+
+
+class ConsoleSink:
+    """Writes rendered lines to stdout (looked up on every write, so redirection works)"""
+
+    def __init__(self, output: Optional[str] = None):
+        # None follows the logger's own output mode
+        self.output = output
+
+    def write_lines(self, lines: List[str]):
+        try:
+            stream = sys.stdout
+            if not _console_colors_ready:
+                _init_console_colors(stream)
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """
+    Buffered file sink with size- and time-based rotation.
+
+    Lines are buffered in memory and written when `buffer_records` lines are
+    pending or `flush_interval` seconds after the first pending line, whichever
+    comes first. Rotated segments are renamed with a timestamp suffix
+    (app.log.20250115-103000-123) and, with compress=True, gzipped on a
+    background thread; only the newest `backup_count` segments are kept.
+    """
+
+    def __init__(self, path: str, output: str = "json", buffer_records: int = 100,
+                 flush_interval: float = 1.0, max_bytes: int = 0,
+                 rotate_interval: Optional[float] = None, backup_count: int = 5,
+                 compress: bool = False):
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output!r} (expected one of {OUTPUT_MODES})")
+        self.path = os.path.abspath(path)
+        self.output = output
+        self.buffer_records = max(1, buffer_records)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._compressors = []
+        self._closed = False
+        self._last_stamp, self._stamp_suffix = None, 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._open()
+        atexit.register(self.close)
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        self._rollover_at = time.time() + self.rotate_interval if self.rotate_interval else None
+
+    def write_lines(self, lines: List[str]):
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer.extend(lines)
+            if len(self._buffer) >= self.buffer_records:
+                self._flush_locked()
+            elif self._timer is None and self.flush_interval is not None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write out buffered lines now"""
+        with self._lock:
+            if not self._closed:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+
+        data = "\n".join(self._buffer) + "\n"
+        self._buffer = []
+        if self._should_rotate(len(data.encode("utf-8"))):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size = self._file.tell()
+
+    def _should_rotate(self, incoming: int) -> bool:
+        if self._size == 0:
+            return False
+        if self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        return self._rollover_at is not None and time.time() >= self._rollover_at
+
+    def _rotate(self):
+        """Move the current file aside and start a new one; compression happens off-thread"""
+        self._file.close()
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+        # Segments rotated within one millisecond get increasing -N suffixes, even
+        # after pruning removed an earlier one, so names keep sorting by age
+        suffix = self._stamp_suffix + 1 if stamp == self._last_stamp else 0
+        rotated = f"{self.path}.{stamp}-{suffix}" if suffix else f"{self.path}.{stamp}"
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            suffix += 1
+            rotated = f"{self.path}.{stamp}-{suffix}"
+        self._last_stamp, self._stamp_suffix = stamp, suffix
+        os.replace(self.path, rotated)
+        self._open()
+
+        if self.compress:
+            self._compressors = [t for t in self._compressors if t.is_alive()]
+            thread = threading.Thread(target=self._compress_segment, args=(rotated,),
+                                      name="pretty-logger-gzip", daemon=True)
+            self._compressors.append(thread)
+            thread.start()
+        else:
+            self._prune_backups()
+
+    def _compress_segment(self, rotated: str):
+        import gzip
+        import shutil
+        try:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(rotated + ".gz.tmp", rotated + ".gz")
+            os.remove(rotated)
+        except OSError:
+            return
+        self._prune_backups()
+
+    def _prune_backups(self):
+        """Delete the oldest rotated segments beyond backup_count"""
+        directory, base = os.path.split(self.path)
+        # Only names _rotate() produces; other files next to the log are left alone
+        pattern = re.escape(base) + r"\.(\d{8}-\d{6}-\d{3})(?:-(\d+))?(?:\.gz)?"
+        segments = []
+        for name in os.listdir(directory):
+            match = re.fullmatch(pattern, name)
+            if match:
+                segments.append((match.group(1), int(match.group(2) or 0), name))
+        segments.sort()
+        for _, _, name in segments[:max(0, len(segments) - self.backup_count)]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    def close(self):
+        """Flush, close the file and wait for pending compression"""
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked()
+            self._closed = True
+            self._file.close()
+        atexit.unregister(self.close)
+        for thread in self._compressors:
+            thread.join()
+
+
+class QueueSink:
+    """Ships rendered lines to a LogAggregator through a multiprocessing queue"""
+
+    def __init__(self, queue, output: str = "pretty"):
+        self.queue = queue
+        self.output = output
+
+    def write_lines(self, lines: List[str]):
+        # One message per batch; the queue keeps each producer's messages in order
+        self.queue.put(lines)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _QueuedWriter:
+    """Background thread that hands batches of queued records to the logger's sinks"""
+
+    def __init__(self, handle, max_queue_size: int = 10000, overflow: str = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r} (expected one of {OVERFLOW_POLICIES})")
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be at least 1")
+
+        self.handle = handle
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.dropped = 0
+
+        self._queue = collections.deque()
+        self._in_flight = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+
+        self._thread = threading.Thread(target=self._run, name="pretty-logger-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: _Record):
+        """Enqueue a record, applying the overflow policy when the queue is full"""
+        with self._lock:
+            if self._closed:
+                return
+            if len(self._queue) >= self.max_queue_size:
+                if self.overflow == "block":
+                    while len(self._queue) >= self.max_queue_size and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        return
+                elif self.overflow == "drop-oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif not self._drop_debug(record):
+                    return
+            self._queue.append(record)
+            self._not_empty.notify()
+
+    def _drop_debug(self, record: _Record) -> bool:
+        """Make room by dropping a debug record; returns False if `record` itself was dropped"""
+        self.dropped += 1
+        if record.level == "debug":
+            return False
+        for index, queued in enumerate(self._queue):
+            if queued.level == "debug":
+                del self._queue[index]
+                return True
+        self._queue.popleft()
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if not self._queue:
+                    return
+                batch = self._queue
+                self._queue = collections.deque()
+                self._in_flight = len(batch)
+                self._not_full.notify_all()
+
+            try:
+                self.handle(batch)
+            except Exception as e:
+                # Keep the thread alive: a dead writer would leave flush() timing
+                # out and, under "block", every later log call waiting forever
+                _report_internal_error(f"writing {len(batch)} queued records", e)
+            finally:
+                with self._lock:
+                    self._in_flight = 0
+                    if not self._queue:
+                        self._drained.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued record has been written; returns False on timeout"""
+        with self._lock:
+            return self._drained.wait_for(lambda: not self._queue and not self._in_flight, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """Write everything still queued, then stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+
+
 class PrettyLogger:
-    def __init__(self, name: str = "app"):
+    _LEVEL_PREFIXES = {
+        "info": f"{Colors.BLUE}ℹ️  INFO{Colors.RESET}    ",
+        "warn": f"{Colors.YELLOW}⚠️  WARNING{Colors.RESET} ",
+        "error": f"{Colors.RED}🔴 ERROR{Colors.RESET}   ",
+        "success": f"{Colors.GREEN}✅ SUCCESS{Colors.RESET} ",
+        "debug": f"{Colors.MAGENTA}🔍 DEBUG{Colors.RESET}   ",
+    }
+
+    _JSON_LEVEL_NAMES = {
+        "info": "info",
+        "warn": "warning",
+        "error": "error",
+        "success": "success",
+        "debug": "debug",
+    }
+
+    def __init__(self, name: str = "app", level: Optional[Union[int, str]] = None,
+                 output: Optional[str] = None, serializer: Optional[Callable[[Any], Union[str, bytes]]] = None,
+                 sinks: Optional[List[Any]] = None, queued: bool = False,
+                 max_queue_size: int = 10000, overflow: str = "block"):
         self.name = name
-        self.debug_enabled = os.environ.get("DEBUG", "false").lower() in ["true", "1", "yes"]
-        
+        self.sinks = list(sinks) if sinks is not None else [ConsoleSink()]
+        self.level = _default_level() if level is None else _resolve_level(level)
+        self._writer = None
+        self._ts_cache = (None, "")
+        self._iso_cache = (None, "")
+        self._process_tag = ""
+        self._process_fields = {}
+        self._rate_limiter = None
+        self._sampling = {}
+        self.sampled_out = 0
+        self._histograms = {}
+        self._histograms_lock = threading.Lock()
+        self.set_output(output or _default_output(), serializer)
+        if queued:
+            self.enable_queue(max_queue_size, overflow)
+
+    def set_level(self, level: Union[int, str]):
+        """Set the minimum level that is emitted"""
+        self.level = _resolve_level(level)
+
+    def is_enabled_for(self, level: Union[int, str]) -> bool:
+        """Check whether a message at `level` would be emitted"""
+        return _resolve_level(level) >= self.level
+
+    @property
+    def debug_enabled(self) -> bool:
+        return self.level <= DEBUG
+
+    @debug_enabled.setter
+    def debug_enabled(self, enabled: bool):
+        self.level = DEBUG if enabled else max(self.level, INFO)
+
+    def set_output(self, output: str, serializer: Optional[Callable[[Any], Union[str, bytes]]] = None):
+        """
+        Choose the output mode: "pretty" (colors, emoji, indented objects) or
+        "json" (one compact JSON object per line).
+
+        serializer replaces the built-in compact encoder in JSON mode, e.g.
+        `orjson.dumps`; it may return str or bytes.
+        """
+        output = output.strip().lower()
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output!r} (expected one of {OUTPUT_MODES})")
+        self.output = output
+        # None means the compact stdlib encoder, built on first use
+        self._serializer = serializer
+
+    def add_sink(self, sink):
+        """
+        Send records to another sink as well. A sink has an `output` attribute
+        ("pretty", "json", or None for the logger's mode) and write_lines(),
+        flush() and close() methods.
+        """
+        self.sinks = self.sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        """Stop sending records to `sink` (it is not closed)"""
+        self.sinks = [s for s in self.sinks if s is not sink]
+
+    def set_rate_limit(self, rate: Optional[float], burst: Optional[int] = None, by: str = "template",
+                       levels: tuple = ("debug", "info", "success", "warn"),
+                       summary_interval: float = 10.0):
+        """
+        Limit repetitive records with a token bucket per key: `rate` records per
+        second with bursts of up to `burst`. `by` selects the key: "template"
+        (the first argument, so pass values as separate or %-style arguments)
+        or "call_site" (the file and line of the logging call). Every
+        `summary_interval` seconds a "Suppressed N similar messages" line is
+        written for each key that dropped records, and the remaining counts are
+        written by close() and at exit. Pass rate=None to disable.
+        """
+        self._report_suppressed(force=True)
+        atexit.unregister(self._report_suppressed)
+        if rate is None:
+            self._rate_limiter = None
+            return
+        burst = burst if burst is not None else max(1, int(rate))
+        self._rate_limiter = _RateLimiter(rate, burst, by, tuple(levels), summary_interval)
+        atexit.register(self._report_suppressed, True)
+
+    def set_sampling(self, rates: Optional[Dict[str, float]]):
+        """
+        Keep a random fraction of records per level, e.g. {"debug": 0.01}.
+        Pass None to keep everything again.
+        """
+        rates = dict(rates or {})
+        for level_name, rate in rates.items():
+            if level_name not in self._LEVEL_PREFIXES:
+                raise ValueError(f"Unknown log level: {level_name!r}")
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError("Sampling rates must be between 0 and 1")
+        self._sampling = rates
+
+    def bind(self, **fields) -> contextvars.Token:
+        """
+        Attach fields to every record logged from the current context (the
+        current asyncio task, or thread) by any logger. Tasks created afterwards
+        inherit them. Returns a token for unbind_token().
+        """
+        current = _bound_context.get()
+        return _bound_context.set(_BoundContext({**current.fields, **fields}))
+
+    def unbind(self, *keys):
+        """Remove bound fields from the current context"""
+        current = _bound_context.get()
+        remaining = {key: value for key, value in current.fields.items() if key not in keys}
+        _bound_context.set(_BoundContext(remaining) if remaining else _EMPTY_CONTEXT)
+
+    def unbind_token(self, token: contextvars.Token):
+        """Restore the bound fields to what they were before the bind() that returned `token`"""
+        _bound_context.reset(token)
+
+    @contextlib.contextmanager
+    def context(self, **fields):
+        """Bind fields for the duration of a with block"""
+        token = self.bind(**fields)
+        try:
+            yield self
+        finally:
+            _bound_context.reset(token)
+
+    def bound_fields(self) -> Dict[str, Any]:
+        """Fields currently bound in this context"""
+        return dict(_bound_context.get().fields)
+
+    def span(self, name: str, level: str = "debug", **fields) -> _Span:
+        """
+        Time a block or function. On exit the duration is logged at `level` as
+        a `duration_ms` field (with `fields` and the exception type, if any),
+        and added to the latency histogram for `name`, which is recorded even
+        when `level` is disabled.
+        """
+        if level not in self._LEVEL_PREFIXES:
+            raise ValueError(f"Unknown log level: {level!r}")
+        caller = sys._getframe(1)
+        return _Span(self, name, level, fields, (caller.f_code.co_filename, caller.f_lineno))
+
+    def _finish_span(self, span: _Span, seconds: float, exc_type):
+        with self._histograms_lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = _LatencyHistogram()
+            histogram.add(seconds)
+
+        if self.level <= LEVELS[span.level]:
+            fields = {"span": span.name, "duration_ms": round(seconds * 1000, 3)}
+            fields.update(span.fields)
+            if exc_type is not None:
+                fields["error"] = exc_type.__name__
+            self._emit(span.level, (f"⏱️  {span.name}", fields), span.site)
+
+    def span_stats(self) -> Dict[str, Dict[str, float]]:
+        """Count and p50/p95/p99/max/mean latency (ms) for every span name"""
+        with self._histograms_lock:
+            return {name: histogram.summary() for name, histogram in self._histograms.items()}
+
+    def dump_spans(self, level: str = "info", reset: bool = False):
+        """Log the latency summary of each span name (never sampled or rate limited)"""
+        for name, stats in sorted(self.span_stats().items()):
+            self._write_record(level, (f"⏱️  {name} latency", stats))
+        if reset:
+            with self._histograms_lock:
+                self._histograms = {}
+
+    def dump_spans_at_exit(self, level: str = "info"):
+        """Log the span latency summary when the interpreter exits"""
+        atexit.register(self.dump_spans, level)
+
+    def tag_process(self, worker_name: Optional[str] = None):
+        """Include this process's pid and worker name in every record"""
+        pid = os.getpid()
+        if not worker_name:
+            import multiprocessing
+            worker_name = multiprocessing.current_process().name
+        self._process_tag = f"{Colors.CYAN}[{worker_name}:{pid}]{Colors.RESET} "
+        self._process_fields = {"pid": pid, "worker": worker_name}
+
+    def enable_queue(self, max_queue_size: int = 10000, overflow: str = "block"):
+        """
+        Switch to queued mode: log calls only enqueue a record and a background
+        thread formats and writes batches to stdout.
+
+        overflow controls what happens when the queue is full:
+            "block"            - wait for the writer to catch up
+            "drop-oldest"      - discard the oldest queued record
+            "drop-debug-first" - discard a debug record (the oldest queued one, or
+                                 the new one), falling back to the oldest record
+        """
+        if self._writer is not None:
+            self.close()
+        self._writer = _QueuedWriter(self._dispatch, max_queue_size, overflow)
+        _queued_loggers.add(self)
+        atexit.register(self.close)
+
+    @property
+    def dropped(self) -> int:
+        """Number of records discarded by the overflow policy"""
+        return self._writer.dropped if self._writer else 0
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued records are written, then flush every sink"""
+        self._report_suppressed(force=True)
+        drained = self._writer.flush(timeout) if self._writer is not None else True
+        for sink in self.sinks:
+            sink.flush()
+        return drained
+
+    def close(self):
+        """Report suppressed records, flush queued records and return to synchronous printing"""
+        self._report_suppressed(force=True)
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        atexit.unregister(self.close)
+        writer.close()
+        if writer.dropped:
+            self._emit("warn", (f"{writer.dropped} log records dropped (queue overflow)",))
+        for sink in self.sinks:
+            sink.flush()
+
     def _format_object(self, obj: Any) -> str:
         """Format objects for better readability"""
         if isinstance(obj, (dict, list)):
+            import json
             return json.dumps(obj, indent=2, default=str)
         return str(obj)
-    
-    def _timestamp(self) -> str:
-        """Generate a formatted timestamp"""
-        now = datetime.datetime.now()
-        return f"{Colors.DIM}[{now.isoformat(timespec='milliseconds')}]{Colors.RESET}"
-    
+
+    def _timestamp(self, created: Optional[float] = None) -> str:
+        """Generate a formatted timestamp (reused for records in the same millisecond)"""
+        if created is None:
+            created = time.time()
+        key = int(created * 1000)
+        cached_key, cached = self._ts_cache
+        if key != cached_key:
+            now = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(key // 1000))
+            cached = f"{Colors.DIM}[{now}.{key % 1000:03d}]{Colors.RESET}"
+            self._ts_cache = (key, cached)
+        return cached
+
     def _format_message(self, *args) -> str:
-        """Format all arguments into a single message string"""
+        """
+        Format all arguments into a single message string.
+
+        lazy() arguments are evaluated here, and a leading %-style format
+        string consumes as many of the following arguments as it has specifiers,
+        so that work only happens for messages that are actually emitted.
+        """
         message_parts = []
-        for arg in args:
+        for arg in self._resolve_args(args):
             if isinstance(arg, (dict, list)):
                 message_parts.append(self._format_object(arg))
             else:
                 message_parts.append(str(arg))
         return " ".join(message_parts)
-    
+
+    def _resolve_args(self, args: tuple) -> List[Any]:
+        """Evaluate deferred arguments and apply a leading %-style format string"""
+        args = [arg.func() if isinstance(arg, _Lazy) else arg for arg in args]
+        if len(args) > 1 and isinstance(args[0], str) and "%" in args[0]:
+            args = self._apply_percent_format(args)
+        return args
+
+    def _apply_percent_format(self, args: List[Any]) -> List[Any]:
+        """Merge `args[0] % args[1:n+1]` for a format string with n specifiers"""
+        specs = [m for m in re.findall(_PERCENT_SPEC, args[0]) if m != "%%"]
+        if not specs:
+            return args
+        try:
+            if specs[0].startswith("%("):
+                if not isinstance(args[1], dict):
+                    return args
+                return [args[0] % args[1]] + args[2:]
+            if len(specs) > len(args) - 1:
+                return args
+            return [args[0] % tuple(args[1:len(specs) + 1])] + args[len(specs) + 1:]
+        except (TypeError, ValueError, KeyError):
+            return args
+
+    def _iso_timestamp(self, created: float) -> str:
+        """UTC ISO-8601 timestamp for JSON records (reused within a millisecond)"""
+        key = int(created * 1000)
+        cached_key, cached = self._iso_cache
+        if key != cached_key:
+            now = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(key // 1000))
+            cached = f"{now}.{key % 1000:03d}Z"
+            self._iso_cache = (key, cached)
+        return cached
+
+    def _render(self, record: _Record, output: Optional[str] = None) -> Optional[str]:
+        """Render a record as a single output line (None if the format skips it)"""
+        if (output or self.output) == "json":
+            if record.level is None:
+                return None
+            return self._render_json(record)
+        if record.level is None:
+            return record.args[0]
+        message = self._format_message(*record.args)
+        return (f"{self._timestamp(record.created)} {self._process_tag}"
+                f"{self._LEVEL_PREFIXES[record.level]}{record.context.pretty}{message}")
+
+    def _render_json(self, record: _Record) -> str:
+        """Render a record as one compact JSON object; dict arguments become fields"""
+        message_parts = []
+        fields = dict(record.context.fields)
+        for arg in self._resolve_args(record.args):
+            if isinstance(arg, dict):
+                fields.update(arg)
+            elif isinstance(arg, list):
+                fields.setdefault("args", []).append(arg)
+            else:
+                message_parts.append(str(arg))
+
+        entry = {
+            "ts": self._iso_timestamp(record.created),
+            "level": self._JSON_LEVEL_NAMES[record.level],
+            "logger": self.name,
+            "msg": " ".join(message_parts),
+            "fields": fields,
+        }
+        if self._process_fields:
+            entry.update(self._process_fields)
+        line = (self._serializer or _compact_json_encoder())(entry)
+        return line.decode("utf-8") if isinstance(line, bytes) else line
+
+    def _dispatch(self, records):
+        """Render records once per output format and fan the lines out to every sink"""
+        rendered = {}
+        for sink in self.sinks:
+            output = sink.output or self.output
+            lines = rendered.get(output)
+            if lines is None:
+                lines = rendered[output] = self._render_batch(records, output)
+            if lines:
+                try:
+                    sink.write_lines(lines)
+                except Exception as e:
+                    _report_internal_error(f"{type(sink).__name__}.write_lines", e)
+
+    def _render_batch(self, records, output: str) -> List[str]:
+        lines = []
+        for record in records:
+            try:
+                line = self._render(record, output)
+            except Exception as e:
+                line = f"<unrenderable log record: {e!r}>"
+            if line is not None:
+                lines.append(line)
+        return lines
+
+    def _admit(self, level: str, args: tuple, site: Union[int, tuple]) -> bool:
+        """Apply sampling and rate limiting (see _emit for `site`)"""
+        rate = self._sampling.get(level)
+        if rate is not None and _random_fraction() >= rate:
+            self.sampled_out += 1
+            return False
+
+        limiter = self._rate_limiter
+        if limiter is None or level not in limiter.levels:
+            return True
+        if limiter.by == "call_site":
+            if isinstance(site, int):
+                # 0 = _admit, 1 = _emit, 2 = _emit's caller, 2 + site = the user's code
+                caller = sys._getframe(2 + site)
+                site = (caller.f_code.co_filename, caller.f_lineno)
+            key = site
+        else:
+            key = args[0] if args and isinstance(args[0], str) else (args[0].__class__ if args else None)
+        now = time.monotonic()
+        allowed = limiter.allow(key, now)
+        if now >= limiter._next_summary:
+            self._report_suppressed()
+        elif not allowed and (limiter._timer is None or not limiter._timer.is_alive()):
+            # Without this a burst followed by silence would never be reported
+            timer = threading.Timer(limiter._next_summary - now, self._summary_due, (limiter,))
+            timer.daemon = True
+            limiter._timer = timer
+            timer.start()
+        return allowed
+
+    def _summary_due(self, limiter: _RateLimiter):
+        if self._rate_limiter is limiter:
+            self._report_suppressed(force=True)
+
+    def _report_suppressed(self, force: bool = False):
+        """Write one summary line per rate-limited key that suppressed records"""
+        limiter = self._rate_limiter
+        if limiter is None:
+            return
+        for key, count in limiter.take_summary(time.monotonic(), force):
+            if limiter.by == "call_site":
+                label = f"{os.path.basename(key[0])}:{key[1]}"
+            else:
+                label = key if isinstance(key, str) else getattr(key, "__name__", repr(key))
+            self._write_record("warn", (f"Suppressed {count} similar messages:", repr(label)))
+
+    def _emit(self, level: Optional[str], args: tuple, site: Union[int, tuple] = 1):
+        """
+        Filter a record, then write it (see _write_record). `site` is the
+        record's (file, line) for call-site rate limiting, or how many frames
+        above _emit's caller the user's logging call is (1 for the level
+        methods); the frame is only looked up when it is needed.
+        """
+        if level is not None and (self._rate_limiter is not None or self._sampling):
+            if not self._admit(level, args, site):
+                return
+        self._write_record(level, args)
+
+    def _write_record(self, level: Optional[str], args: tuple):
+        """Write a record now, or hand it to the writer thread in queued mode"""
+        record = _Record(time.time(), level, args, _bound_context.get())
+        writer = self._writer
+        if writer is not None:
+            writer.put(record)
+        else:
+            self._dispatch((record,))
+
+    def _write_line(self, line: str):
+        """Emit a pre-rendered line (dividers) in order with log records"""
+        self._emit(None, (line,))
+
     def info(self, *args):
         """Log an info message"""
-        message = self._format_message(*args)
-        print(f"{self._timestamp()} {Colors.BLUE}ℹ️  INFO{Colors.RESET}    {message}")
-    
+        if self.level <= INFO:
+            self._emit("info", args)
+
     def warn(self, *args):
         """Log a warning message"""
-        message = self._format_message(*args)
-        print(f"{self._timestamp()} {Colors.YELLOW}⚠️  WARNING{Colors.RESET} {message}")
-    
+        if self.level <= WARNING:
+            self._emit("warn", args)
+
     def error(self, *args):
         """Log an error message"""
-        message = self._format_message(*args)
-        print(f"{self._timestamp()} {Colors.RED}🔴 ERROR{Colors.RESET}   {message}")
-    
+        if self.level <= ERROR:
+            self._emit("error", args)
+
     def success(self, *args):
         """Log a success message"""
-        message = self._format_message(*args)
-        print(f"{self._timestamp()} {Colors.GREEN}✅ SUCCESS{Colors.RESET} {message}")
-    
+        if self.level <= SUCCESS:
+            self._emit("success", args)
+
     def debug(self, *args):
-        """Log a debug message (only if DEBUG environment variable is set)"""
-        if not self.debug_enabled:
-            return
-        
-        message = self._format_message(*args)
-        print(f"{self._timestamp()} {Colors.MAGENTA}🔍 DEBUG{Colors.RESET}   {message}")
-    
+        """Log a debug message (only if the level threshold allows debug output)"""
+        if self.level <= DEBUG:
+            self._emit("debug", args)
+
     def divider(self, title: str = ""):
         """Create a visual divider with optional title"""
-        width = os.get_terminal_size().columns if sys.stdout.isatty() else 80
-        
-        if title:
-            line = "─" * (width - len(title) - 4)
-            print(f"{Colors.DIM}┌─ {Colors.BOLD}{title}{Colors.RESET}{Colors.DIM} {line}{Colors.RESET}")
-        else:
-            line = "─" * (width - 2)
-            print(f"{Colors.DIM}┌{line}┐{Colors.RESET}")
-    
+        self._write_line(_render_divider(title, _terminal_width.get()))
+
     def divider_end(self):
         """End a divider section"""
-        width = os.get_terminal_size().columns if sys.stdout.isatty() else 80
-        line = "─" * (width - 2)
-        print(f"{Colors.DIM}└{line}┘{Colors.RESET}")
+        self._write_line(_render_divider_end(_terminal_width.get()))
+
+
+# Loggers in queued mode; a forked child gets fresh writer threads for them
+_queued_loggers = weakref.WeakSet()
+
+
+def _restart_writers_after_fork():
+    """The parent's writer thread does not exist in a forked child, so start new ones"""
+    for queued_logger in list(_queued_loggers):
+        writer = queued_logger._writer
+        if writer is not None:
+            queued_logger._writer = _QueuedWriter(queued_logger._dispatch, writer.max_queue_size, writer.overflow)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_writers_after_fork)
+
+
+def _console_sinks() -> List[Any]:
+    return [ConsoleSink()]
+
+
+def _aggregate(queue, sink_factory, batch_size: int):
+    """Aggregator process: drain batches of lines from workers and write them"""
+    from queue import Empty
+
+    sinks = sink_factory()
+    running = True
+    while running:
+        lines = []
+        item = queue.get()
+        while True:
+            if item is None:
+                running = False
+                break
+            lines.extend(item)
+            if len(lines) >= batch_size:
+                break
+            try:
+                item = queue.get_nowait()
+            except Empty:
+                break
+        if lines:
+            for sink in sinks:
+                try:
+                    sink.write_lines(lines)
+                except Exception as e:
+                    _report_internal_error(f"{type(sink).__name__}.write_lines", e)
+    for sink in sinks:
+        sink.close()
+
+
+class LogAggregator:
+    """
+    Single writer process for logs from many worker processes.
+
+    Workers render their own records (spreading the formatting cost) and put
+    whole lines on a shared queue; the aggregator is the only process that
+    writes, so lines never tear. The queue is FIFO per producer, so each
+    worker's records keep their order.
+
+    sink_factory is called inside the aggregator process to build its sinks
+    (default: stdout). Under the "spawn" start method it must be a module-level
+    function.
+    """
+
+    def __init__(self, output: str = "pretty", sink_factory: Callable[[], List[Any]] = _console_sinks,
+                 max_queue_size: int = 0, batch_size: int = 1000, context=None):
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output!r} (expected one of {OUTPUT_MODES})")
+        import multiprocessing
+        ctx = context or multiprocessing.get_context()
+        self.output = output
+        self.queue = ctx.Queue(max_queue_size)
+        self._process = ctx.Process(target=_aggregate, args=(self.queue, sink_factory, batch_size),
+                                    name="pretty-logger-aggregator", daemon=True)
+
+    def start(self):
+        self._process.start()
+        return self
+
+    def connect(self, target_logger: Optional["PrettyLogger"] = None, worker_name: Optional[str] = None):
+        """Route `target_logger` (default: the module logger) in this process to the aggregator"""
+        return connect_to_aggregator(self.queue, self.output, worker_name, target_logger)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Write everything already sent, then shut the aggregator process down"""
+        if not self._process.is_alive():
+            return
+        self.queue.put(None)
+        self._process.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def connect_to_aggregator(queue, output: str = "pretty", worker_name: Optional[str] = None,
+                          target_logger: Optional["PrettyLogger"] = None) -> "PrettyLogger":
+    """
+    Call inside a worker process (e.g. as a Pool initializer) to send its log
+    records to a LogAggregator instead of writing to stdout directly.
+    """
+    import multiprocessing.util
+
+    target_logger = target_logger or logger
+    target_logger.tag_process(worker_name)
+    target_logger.sinks = [QueueSink(queue, output)]
+    # Worker processes skip atexit, so flush pending records through multiprocessing's exit hooks
+    multiprocessing.util.Finalize(target_logger, target_logger.flush, exitpriority=100)
+    return target_logger
 
 
 # Create a singleton instance for import
 logger = PrettyLogger()
 
 if __name__ == "__main__":
+    import datetime
+
     # Run a demo if this file is executed directly
     logger.divider("💫 PYTHON LOGGER DEMO")
     logger.info("Starting application...")
@@ -131,6 +1351,14 @@ if __name__ == "__main__":
     })
     logger.success("Connected to database")
     logger.warn("Cache miss for user profile")
+
+    # Under load the same warning floods the console; rate limit it instead
+    logger.set_rate_limit(rate=2, burst=3)
+    for _ in range(1000):
+        logger.warn("Cache miss for user profile")
+    logger.flush()
+    logger.set_rate_limit(None)
+
     logger.error("Payment processing failed", {
         "error": "Failed to process payment",
         "timestamp": datetime.datetime.now().isoformat()
@@ -0,0 +1,22 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark import IMPORT_BUDGET_MS, measure_import
+
+
+class TestImport(unittest.TestCase):
+    """`import pretty_logger` must stay cheap and quiet"""
+
+    def test_import_is_quiet_and_lazy(self):
+        best_ms, printed, loaded = measure_import(runs=3)
+        self.assertEqual(printed, "", "importing pretty_logger printed to stdout")
+        self.assertEqual(loaded, "", "deferred modules were imported eagerly")
+        # Generous on purpose: catches an eager heavy import, not machine noise.
+        # `python benchmark.py --import-only` checks the real budget.
+        self.assertLess(best_ms, 4 * IMPORT_BUDGET_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()